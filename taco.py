@@ -40,7 +40,7 @@ from PySide6.QtWidgets import (
     QAbstractItemView, QProgressBar, QProgressDialog
 )
 from PySide6.QtGui import (
-    QIcon, QFont, QStandardItem, QClipboard, QColor, QPixmap, QBrush, QPen, QKeySequence, QPainter, QDesktopServices, QAction
+    QIcon, QFont, QStandardItem, QClipboard, QColor, QPixmap, QPixmapCache, QBrush, QPen, QKeySequence, QPainter, QDesktopServices, QAction
 )
 from PySide6.QtCore import (
     Qt, QSettings, QTimer, QSize, QModelIndex, QRectF, QSortFilterProxyModel, QUrl, QRegularExpression,
@@ -49,7 +49,7 @@ from PySide6.QtCore import (
 
 from taco_geo_processor.data.models import HistoryManager, EfficientTableModel, CustomSortFilterProxyModel
 from taco_geo_processor.ui.dialogs import SettingsDialogBase, DXFSettingsDialog, KMLSettingsDialog, FindDialog, PreviewDialog
-from taco_geo_processor.utils.utils import get_icon, safe_float, TXT_DELIMITER_MAP
+from taco_geo_processor.utils.utils import get_icon, safe_float, TXT_DELIMITER_MAP, ICON_PIXMAP_CACHE_LIMIT_KB
 from taco_geo_processor.core.workers import Worker, ExportAllWorker
 import pyproj
 
@@ -1942,6 +1942,7 @@ if __name__ == "__main__":
     RESTART_CODE = 1000  # Local variable instead of config attribute
     
     app = QApplication(sys.argv)
+    QPixmapCache.setCacheLimit(ICON_PIXMAP_CACHE_LIMIT_KB)
     try:
         app.setWindowIcon(get_icon("app_icon.png", size=32))
     except:
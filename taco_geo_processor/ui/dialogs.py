@@ -4,19 +4,48 @@ from PySide6.QtWidgets import (
     QGroupBox, QButtonGroup, QRadioButton, QFrame, QScrollArea, QListWidget, QListWidgetItem,
     QGraphicsView, QGraphicsScene, QGraphicsEllipseItem, QGraphicsSimpleTextItem
 )
-from PySide6.QtCore import Qt, QSize, QTimer
-from PySide6.QtGui import QIcon, QColor, QPalette, QPainter, QFont
+from PySide6.QtCore import Qt, QSize, QTimer, QUrl
+from PySide6.QtGui import QIcon, QColor, QPalette, QPainter, QFont, QDesktopServices
 from taco_geo_processor.core import config
 from taco_geo_processor.utils import utils
 from taco_geo_processor.processing import data_processing as dp
 import os
-import subprocess
+import glob
+import math
+import functools
 import logging
 import sys
 from pathlib import Path
 from PySide6.QtGui import QPixmap
 from PySide6.QtWidgets import QApplication
 
+def _find_app_icon():
+    """Returns the app icon path (PNG preferred over ICO) from a single directory listing."""
+    matches = glob.glob(os.path.join(glob.escape(utils.ICONS_DIR), "app_icon.*"))
+    for ext in (".png", ".ico"):
+        for path in matches:
+            if path.lower().endswith(ext):
+                return path
+    return None
+
+_APP_ICON_PATH = _find_app_icon()
+
+@functools.lru_cache(maxsize=1)
+def _app_brand_color():
+    """Samples the app icon once per process for the brand color, or None on failure."""
+    if not _APP_ICON_PATH:
+        return None
+    pix = QPixmap(_APP_ICON_PATH)
+    if pix.isNull():
+        return None
+    img = pix.toImage()
+    # أخذ بكسل من المركز كتمثيل تقريبي
+    x = max(0, img.width() // 2)
+    y = max(0, img.height() // 2)
+    col = QColor(img.pixel(x, y))
+    # ضمان سطوع/تشبع مقبولين
+    return col if col.isValid() else None
+
 DXF_COLOR_MODES = ["By Entity"]
 DEFAULT_DXF_COLOR_MODE = "By Entity"
 
@@ -1169,12 +1198,27 @@ class FindDialog(QDialog):
 
 class PannableGraphicsView(QGraphicsView):
     """A QGraphicsView that supports panning (with ScrollHandDrag) and zooming."""
+    # Above this many items, repainting the whole viewport is cheaper than
+    # computing the union of the dirty regions on every pan.
+    FULL_UPDATE_ITEM_THRESHOLD = 2000
+
     def __init__(self, scene, parent=None):
         super().__init__(scene, parent)
         self.setRenderHint(QPainter.RenderHint.Antialiasing)
         # Use Qt's built-in panning mechanism
         self.setDragMode(QGraphicsView.DragMode.ScrollHandDrag)
         self.setMouseTracking(True) # Required for hover events to show tooltips
+        # Items never draw outside their bounding rects and restore their own painter state
+        self.setOptimizationFlag(QGraphicsView.OptimizationFlag.DontAdjustForAntialiasing, True)
+        self.setOptimizationFlag(QGraphicsView.OptimizationFlag.DontSavePainterState, True)
+        self.set_item_count(0)
+
+    def set_item_count(self, count):
+        """Pick the viewport update mode best suited to the number of items in the scene."""
+        if count > self.FULL_UPDATE_ITEM_THRESHOLD:
+            self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.FullViewportUpdate)
+        else:
+            self.setViewportUpdateMode(QGraphicsView.ViewportUpdateMode.SmartViewportUpdate)
 
     def wheelEvent(self, event):
         """Zoom in/out with the mouse wheel, with clamping to prevent extreme zoom levels."""
@@ -1221,20 +1265,9 @@ class DeveloperDialog(QDialog):
     def _extract_brand_color(self):
         # محاولة استخراج اللون الأساسي من أيقونة التطبيق
         try:
-            # Corrected path handling
-            icon_path = os.path.join(utils.ICONS_DIR, "app_icon.png")
-            if not os.path.exists(icon_path):
-                icon_path = os.path.join(utils.ICONS_DIR, "app_icon.ico")
-            pix = QPixmap(icon_path)
-            if not pix.isNull():
-                img = pix.toImage()
-                # أخذ بكسل من المركز كتمثيل تقريبي
-                x = max(0, img.width() // 2)
-                y = max(0, img.height() // 2)
-                col = QColor(img.pixel(x, y))
-                # ضمان سطوع/تشبع مقبولين
-                if col.isValid():
-                    return col
+            col = _app_brand_color()
+            if col is not None:
+                return QColor(col)
         except Exception:
             pass
         # لون افتراضي في حال الفشل
@@ -1417,13 +1450,9 @@ class DeveloperDialog(QDialog):
             folder_path = os.path.join(utils.BASE_DIR, folder_name)
             os.makedirs(folder_path, exist_ok=True)
             
-            # Cross-platform way to open a folder
-            if sys.platform == "win32":
-                os.startfile(folder_path)
-            elif sys.platform == "darwin": # macOS
-                subprocess.run(["open", folder_path], check=True)
-            else: # linux
-                subprocess.run(["xdg-open", folder_path], check=True)
+            # Qt hands the folder to the native file manager and returns immediately
+            if not QDesktopServices.openUrl(QUrl.fromLocalFile(folder_path)):
+                raise OSError(f"No application is registered to open {folder_path}")
         except Exception as e:
             QMessageBox.warning(self, "Error", f"Could not open the {folder_name} folder:\n{e}")
 
@@ -1461,6 +1490,9 @@ class PreviewDialog(QDialog):
         
         self.data_df = data_df
         self.has_drawn = False # Flag to ensure initial draw happens only once
+        # Items created by draw_data, kept so color changes can restyle them in place
+        self._point_items = []
+        self._label_items = []
 
         # Default colors
         self.point_color = QColor(Qt.GlobalColor.yellow)
@@ -1521,7 +1553,15 @@ class PreviewDialog(QDialog):
         
         if new_color.isValid():
             setattr(self, f"{target}_color", new_color)
-            self.draw_data() # Redraw with the new color
+            # Restyle the existing items instead of rebuilding the whole scene
+            if target == 'point':
+                for item in self._point_items:
+                    item.setBrush(new_color)
+            elif target == 'text':
+                for item in self._label_items:
+                    item.setBrush(new_color)
+            elif target == 'background':
+                self.scene.setBackgroundBrush(new_color)
 
     def draw_data(self):
         if self.data_df.empty:
@@ -1529,6 +1569,8 @@ class PreviewDialog(QDialog):
             return
 
         self.scene.clear()
+        self._point_items = []
+        self._label_items = []
         
         eastings = self.data_df.get(dp.COL_E)
         northings = self.data_df.get(dp.COL_N)
@@ -1549,6 +1591,8 @@ class PreviewDialog(QDialog):
         point_size = 5
         
         self.scene.setBackgroundBrush(self.background_color)
+        # Skip BSP maintenance while bulk-inserting; the index is rebuilt once afterwards
+        self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.NoIndex)
         for index, row in self.data_df.iterrows():
             try:
                 e = float(row.get(dp.COL_E, 0))
@@ -1568,6 +1612,7 @@ class PreviewDialog(QDialog):
             point.setToolTip(tooltip_text)
             
             self.scene.addItem(point)
+            self._point_items.append(point)
             
             pt_num = str(row.get(dp.COL_PT, ''))
             if pt_num:
@@ -1576,6 +1621,13 @@ class PreviewDialog(QDialog):
                 # Position the label relative to the point, considering scene's inverted Y
                 label.setPos(e + point_size / 2, -n - label.boundingRect().height())
                 self.scene.addItem(label)
+                self._label_items.append(label)
+
+        # The scene is static from here on; size the BSP tree for the point count
+        # instead of letting Qt guess a depth for dense, clustered survey data.
+        self.scene.setItemIndexMethod(QGraphicsScene.ItemIndexMethod.BspTreeIndex)
+        self.scene.setBspTreeDepth(max(4, int(math.log2(len(self.data_df) + 1))))
 
+        self.graphics_view.set_item_count(len(self._point_items) + len(self._label_items))
         self.graphics_view.fitInView(self.scene.itemsBoundingRect(), Qt.AspectRatioMode.KeepAspectRatio)
         self.status_label.setText(f"Displayed {len(self.data_df)} points. Scroll to zoom, drag to pan.")
\ No newline at end of file
@@ -7,6 +7,7 @@ from .arabic_text_helper import (
     initialize_arabic_support,
     fix_arabic,
     is_arabic_text,
+    is_arabic_mask,
     format_arabic_number,
     get_arabic_direction,
     clean_arabic_text
@@ -16,6 +17,7 @@ __all__ = [
     'initialize_arabic_support',
     'fix_arabic',
     'is_arabic_text',
+    'is_arabic_mask',
     'format_arabic_number',
     'get_arabic_direction',
     'clean_arabic_text'
@@ -4,7 +4,30 @@ This module provides functions to handle Arabic text display and formatting.
 """
 
 import logging
-from typing import Optional
+import re
+from typing import Iterable, Optional
+
+import numpy as np
+
+
+# Arabic Unicode ranges
+_ARABIC_RANGES = (
+    (0x0600, 0x06FF),  # Arabic
+    (0x0750, 0x077F),  # Arabic Supplement
+    (0x08A0, 0x08FF),  # Arabic Extended-A
+    (0xFB50, 0xFDFF),  # Arabic Presentation Forms-A
+    (0xFE70, 0xFEFF),  # Arabic Presentation Forms-B
+)
+
+_ARABIC_CHAR_RE = re.compile(
+    "[" + "".join(f"{chr(start)}-{chr(end)}" for start, end in _ARABIC_RANGES) + "]"
+)
+
+# Bound formatters for the usual decimal places, so the format spec is parsed once
+_COMMON_FMTS = {d: f"{{:.{d}f}}".format for d in range(7)}
+
+_ARABIC_LO = np.array([start for start, _ in _ARABIC_RANGES], dtype=np.uint32)
+_ARABIC_HI = np.array([end for _, end in _ARABIC_RANGES], dtype=np.uint32)
 
 
 def initialize_arabic_support():
@@ -64,26 +87,38 @@ def is_arabic_text(text: str) -> bool:
         return False
     
     try:
-        # Check for Arabic Unicode ranges
-        arabic_ranges = [
-            (0x0600, 0x06FF),  # Arabic
-            (0x0750, 0x077F),  # Arabic Supplement
-            (0x08A0, 0x08FF),  # Arabic Extended-A
-            (0xFB50, 0xFDFF),  # Arabic Presentation Forms-A
-            (0xFE70, 0xFEFF),  # Arabic Presentation Forms-B
-        ]
-        
-        for char in text:
-            char_code = ord(char)
-            for start, end in arabic_ranges:
-                if start <= char_code <= end:
-                    return True
-        return False
+        return _ARABIC_CHAR_RE.search(text) is not None
     except Exception as e:
         logging.error(f"Error checking Arabic text: {e}")
         return False
 
 
+def is_arabic_mask(values: Iterable) -> np.ndarray:
+    """
+    Check many strings for Arabic characters in a single vectorized pass.
+    
+    Args:
+        values (Iterable): The values to check, e.g. a DataFrame column.
+            Non-string values are treated as not Arabic.
+        
+    Returns:
+        np.ndarray: A boolean array with one entry per value
+    """
+    texts = [value if isinstance(value, str) else "" for value in values]
+    if not texts:
+        return np.zeros(0, dtype=bool)
+
+    # Join with a non-Arabic sentinel and view the result as code points
+    codes = np.frombuffer("\x00".join(texts).encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    in_range = ((codes[:, None] >= _ARABIC_LO) & (codes[:, None] <= _ARABIC_HI)).any(axis=1)
+
+    # Count Arabic code points per text via a running sum over each slice
+    hits = np.concatenate(([0], np.cumsum(in_range)))
+    lengths = np.fromiter((len(text) for text in texts), dtype=np.intp, count=len(texts))
+    starts = np.concatenate(([0], np.cumsum(lengths[:-1] + 1)))
+    return hits[starts + lengths] > hits[starts]
+
+
 def format_arabic_number(number: float, decimal_places: int = 2) -> str:
     """
     Format a number for display in Arabic context.
@@ -100,8 +135,8 @@ def format_arabic_number(number: float, decimal_places: int = 2) -> str:
             return ""
         
         # Format the number with specified decimal places
-        formatted = f"{number:.{decimal_places}f}"
-        return formatted
+        fmt = _COMMON_FMTS.get(decimal_places)
+        return fmt(number) if fmt else format(number, f".{decimal_places}f")
     except Exception as e:
         logging.error(f"Error formatting Arabic number: {e}")
         return str(number) if number is not None else ""
@@ -134,10 +169,13 @@ def clean_arabic_text(text: str) -> str:
         # Remove extra whitespace
         cleaned = " ".join(text.split())
         
+        # Nothing to strip in the common case; str.isprintable scans in C
+        if cleaned.isprintable():
+            return cleaned
+
         # Remove any non-printable characters except Arabic ones
-        cleaned = "".join(char for char in cleaned if char.isprintable() or is_arabic_text(char))
-        
-        return cleaned
+        arabic_match = _ARABIC_CHAR_RE.match
+        return "".join(char for char in cleaned if char.isprintable() or arabic_match(char))
     except Exception as e:
         logging.error(f"Error cleaning Arabic text: {e}")
         return text
@@ -1,8 +1,9 @@
-from PySide6.QtGui import QIcon, QPixmap, QPainter, QColor
+from PySide6.QtGui import QIcon, QPixmap, QPixmapCache, QPainter, QColor
 from PySide6.QtCore import QSize, Qt
 import os
 
 DEFAULT_ICON_SIZE = 32
+ICON_PIXMAP_CACHE_LIMIT_KB = 20480
 
 import sys
 import os
@@ -18,7 +19,13 @@ def get_icon(filename, size=DEFAULT_ICON_SIZE, color=None):
     """
     Returns a QIcon from a file in the icons folder with a custom size and optional color.
     If a color is provided, the icon will be colorized.
+    Rendered pixmaps are kept in QPixmapCache, keyed by (filename, size, color).
     """
+    cache_key = f"taco_icon|{filename}|{size}|{color}"
+    cached = QPixmapCache.find(cache_key)
+    if cached is not None and not cached.isNull():
+        return QIcon(cached)
+
     path = os.path.join(ICONS_DIR, filename)
     if not os.path.exists(path):
         return QIcon()
@@ -38,7 +45,8 @@ def get_icon(filename, size=DEFAULT_ICON_SIZE, color=None):
 
     if size:
         pixmap = pixmap.scaled(QSize(size, size), Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-    
+
+    QPixmapCache.insert(cache_key, pixmap)
     return QIcon(pixmap)
 
 def safe_float(val, default=0.0):
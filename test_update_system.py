@@ -21,49 +21,21 @@ def test_update_client_directly():
     try:
         print(f"Running: python {updater_path} --check-online {manifest_url}")
         
-        # Run the update client
+        # Run the update client; the child writes UTF-8 JSON to stdout
         result = subprocess.run(
             [sys.executable, updater_path, '--check-online', manifest_url],
             capture_output=True,
-            text=False,  # Don't decode to text automatically
+            encoding='utf-8',
+            errors='replace',
             timeout=30
         )
         
         print(f"Return code: {result.returncode}")
-        print(f"Stdout length: {len(result.stdout)} bytes")
-        print(f"Stderr length: {len(result.stderr)} bytes")
+        print(f"Stdout length: {len(result.stdout)} chars")
+        print(f"Stderr length: {len(result.stderr)} chars")
         
-        # Try to decode stdout
-        stdout_text = None
-        if isinstance(result.stdout, bytes):
-            encodings_to_try = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
-            for encoding in encodings_to_try:
-                try:
-                    stdout_text = result.stdout.decode(encoding)
-                    print(f"✅ Successfully decoded stdout with {encoding}")
-                    break
-                except UnicodeDecodeError as e:
-                    print(f"❌ Failed to decode with {encoding}: {e}")
-                    continue
-            else:
-                stdout_text = result.stdout.decode('utf-8', errors='replace')
-                print("⚠️ Used UTF-8 with error replacement for stdout")
-        
-        # Try to decode stderr
-        stderr_text = None
-        if isinstance(result.stderr, bytes):
-            encodings_to_try = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
-            for encoding in encodings_to_try:
-                try:
-                    stderr_text = result.stderr.decode(encoding)
-                    print(f"✅ Successfully decoded stderr with {encoding}")
-                    break
-                except UnicodeDecodeError as e:
-                    print(f"❌ Failed to decode with {encoding}: {e}")
-                    continue
-            else:
-                stderr_text = result.stderr.decode('utf-8', errors='replace')
-                print("⚠️ Used UTF-8 with error replacement for stderr")
+        stdout_text = result.stdout
+        stderr_text = result.stderr
         
         print(f"\nStdout content: {stdout_text}")
         print(f"\nStderr content: {stderr_text}")
@@ -9,12 +9,13 @@
 للتطبيق أن يستبدل ملفاته الخاصة أثناء تشغيله.
 
 المهام:
-1.  يستقبل مسار حزمة التحديث ومسار مجلد التطبيق الرئيسي كوسيطات.
+1.  يستقبل مسار حزمة التحديث ومسار مجلد التطبيق الرئيسي كوسيطات
+    (أو `--rollback <مجلد_النسخة_الاحتياطية>` لاسترجاع النسخة الاحتياطية وملف VERSION السابق فقط).
 2.  ينشئ نسخة احتياطية من مجلد `taco_geo_processor` الحالي.
 3.  يستخرج الملفات الجديدة من حزمة التحديث.
 4.  يستبدل المجلد القديم بالجديد.
 5.  في حال حدوث أي خطأ، يقوم بإرجاع النسخة الاحتياطية (Rollback).
-6.  بعد النجاح، يقوم بحذف النسخة الاحتياطية.
+6.  بعد النجاح، يقوم بحذف النسخة الاحتياطية في عملية منفصلة بالخلفية.
 7.  يحدّث ملف `VERSION` برقم الإصدار الجديد من الـ manifest.
 8.  ينشئ ملف `_update_success.flag` كعلامة للعملية الأم بنجاح التحديث.
 """
@@ -23,30 +24,122 @@ import os
 import sys
 import shutil
 import zipfile
+import subprocess
 import json
 import time
 
+# فك ضغط أسرع (SIMD) عبر zlib-ng إن كانت مثبتة؛ واجهة zipfile تبقى كما هي
+try:
+    from zlib_ng import zlib_ng as _fast_zlib
+    zipfile.zlib = _fast_zlib
+    zipfile.crc32 = _fast_zlib.crc32
+except ImportError:
+    pass
+
+PACKAGE_DIR_NAME = 'taco_geo_processor'
+BACKUP_DIR_NAME = 'taco_geo_processor_backup'
+VERSION_FILE_NAME = 'VERSION'
+VERSION_BACKUP_NAME = 'VERSION.bak'  # ملف VERSION السابق، يُستعاد مع النسخة الاحتياطية
+SUCCESS_FLAG_NAME = '_update_success.flag'
+ZIP_PREFIX = PACKAGE_DIR_NAME + '/'  # مسارات ZIP تستخدم دائماً '/'
+
 def log(message):
     """دالة بسيطة لطباعة الرسائل مع الوقت."""
     print(f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}")
 
-def main():
+def remove_dir_in_background(path):
+    """يحذف مجلداً في عملية منفصلة حتى لا ينتظر المستخدم انتهاء الحذف."""
+    # إعادة التسمية أولاً إلى اسم فريد: المسار الأصلي يتحرر فوراً فلا يجد التراجع أو تحديث لاحق
+    # نسخة نصف محذوفة، ولا يستمر الحذف داخل مجلد نُقل إلى المسار الأصلي
+    doomed_path = f"{path}.delete-{os.getpid()}"
+    try:
+        os.replace(path, doomed_path)
+    except OSError as e:
+        log(f"تعذرت إعادة تسمية المجلد قبل حذفه ({e})، يتم الحذف مباشرة...")
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    path = doomed_path
+
+    try:
+        if os.name == 'nt':
+            subprocess.Popen(
+                [sys.executable, '-c', 'import shutil, sys; shutil.rmtree(sys.argv[1], ignore_errors=True)', path],
+                creationflags=subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP,
+                close_fds=True,
+            )
+        elif os.fork() == 0:
+            # العملية الابنة: الانفصال عن الأم ثم الحذف والخروج مباشرة
+            try:
+                os.setsid()
+                shutil.rmtree(path, ignore_errors=True)
+            finally:
+                os._exit(0)
+    except Exception as e:
+        log(f"تعذر بدء الحذف في الخلفية ({e})، يتم الحذف مباشرة...")
+        shutil.rmtree(path, ignore_errors=True)
+
+def restore_backup(backup_dir, app_dir):
+    """
+    يعيد النسخة الاحتياطية مكان مجلد الحزمة بعد حذف أي ملفات جديدة غير مكتملة،
+    ويستعيد ملف VERSION السابق ويزيل علامة النجاح حتى لا تُعامل الحالة كتحديث ناجح.
+    """
+    target_dir = os.path.join(app_dir, PACKAGE_DIR_NAME)
+    if os.path.exists(target_dir):
+        shutil.rmtree(target_dir)
+    shutil.move(backup_dir, target_dir)
+
+    version_backup = os.path.join(app_dir, VERSION_BACKUP_NAME)
+    if os.path.exists(version_backup):
+        os.replace(version_backup, os.path.join(app_dir, VERSION_FILE_NAME))
+    try:
+        os.remove(os.path.join(app_dir, SUCCESS_FLAG_NAME))
+    except FileNotFoundError:
+        pass
+
+def rollback(backup_dir):
+    """يسترجع النسخة الاحتياطية (وملف VERSION السابق) إلى مجلد التطبيق المجاور لها."""
+    log("بدء عملية التراجع عن التحديث...")
+    backup_dir = os.path.abspath(backup_dir)
+    app_dir = os.path.dirname(backup_dir)
+    if not os.path.isdir(backup_dir):
+        log(f"خطأ: النسخة الاحتياطية غير موجودة في {backup_dir}")
+        sys.exit(1)
+    try:
+        restore_backup(backup_dir, app_dir)
+    except Exception as e:
+        log(f"فشل التراجع عن التحديث: {e}")
+        sys.exit(1)
+    log("تم استرجاع النسخة الاحتياطية بنجاح.")
+
+def main(argv=None):
+    """
+    نقطة الدخول. تُستدعى من سطر الأوامر، أو مباشرة من `update_client_new.py`
+    بقائمة وسيطات (بعد fork) لتجنب بدء مفسّر Python جديد.
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+
+    if len(argv) == 2 and argv[0] == '--rollback':
+        rollback(argv[1])
+        return
+
     log("بدء عملية تطبيق التحديث...")
 
     # 1. قراءة الوسيطات من سطر الأوامر
-    if len(sys.argv) != 3:
+    if len(argv) != 2:
         log("خطأ: الوسيطات غير كافية.")
         log("الاستخدام: python apply_update.py <مسار_حزمة_التحديث> <مسار_التطبيق_الرئيسي>")
+        log("          python apply_update.py --rollback <مجلد_النسخة_الاحتياطية>")
         sys.exit(1)
 
-    zip_path = sys.argv[1]
-    app_dir = sys.argv[2]
+    zip_path = argv[0]
+    app_dir = argv[1]
 
     # تحديد المسارات الهامة
-    target_dir = os.path.join(app_dir, 'taco_geo_processor')
-    backup_dir = os.path.join(app_dir, 'taco_geo_processor_backup')
-    version_file = os.path.join(app_dir, 'VERSION')
-    success_flag = os.path.join(app_dir, '_update_success.flag')
+    target_dir = os.path.join(app_dir, PACKAGE_DIR_NAME)
+    backup_dir = os.path.join(app_dir, BACKUP_DIR_NAME)
+    version_file = os.path.join(app_dir, VERSION_FILE_NAME)
+    version_backup = os.path.join(app_dir, VERSION_BACKUP_NAME)
+    success_flag = os.path.join(app_dir, SUCCESS_FLAG_NAME)
 
     # التأكد من أن المسارات موجودة
     if not os.path.exists(zip_path):
@@ -59,25 +152,26 @@ def main():
     # --- بدء عملية التحديث ---
     try:
         # 2. إنشاء نسخة احتياطية
-        log(f"إنشاء نسخة احتياطية من '{os.path.basename(target_dir)}' إلى '{os.path.basename(backup_dir)}'...")
+        log(f"إنشاء نسخة احتياطية من '{PACKAGE_DIR_NAME}' إلى '{BACKUP_DIR_NAME}'...")
         if os.path.exists(backup_dir):
             shutil.rmtree(backup_dir) # حذف أي نسخة احتياطية قديمة
         shutil.move(target_dir, backup_dir)
+        # حفظ ملف VERSION الحالي مع النسخة الاحتياطية (وحذف أي نسخة قديمة لا تخصها)
+        if os.path.exists(version_file):
+            shutil.copy2(version_file, version_backup)
+        elif os.path.exists(version_backup):
+            os.remove(version_backup)
         log("تم إنشاء النسخة الاحتياطية بنجاح.")
 
-        # 3. استخراج حزمة التحديث
+        # 3. استخراج حزمة التحديث وقراءة الـ manifest في فتح واحد للحزمة
         log(f"استخراج الملفات من {os.path.basename(zip_path)}...")
-        with zipfile.ZipFile(zip_path, 'r') as zipf:
-            # استخراج مجلد taco_geo_processor فقط
-            members = [m for m in zipf.namelist() if m.startswith('taco_geo_processor/')]
-            zipf.extractall(app_dir, members=members)
-        log("تم استخراج الملفات الجديدة بنجاح.")
-
-        # 4. Read the new version from the manifest inside the zip
-        log("Reading new version number...")
         new_version = "0.0.0"
         with zipfile.ZipFile(zip_path, 'r') as zipf:
-            names = set(zipf.namelist())
+            infolist = zipf.infolist()
+            names = {info.filename for info in infolist}
+
+            # 4. Read the new version from the manifest inside the zip
+            log("Reading new version number...")
             manifest_name = None
             for candidate in ('update_manifest.json', 'Survey_new_vergn_update_manifest.json'):
                 if candidate in names:
@@ -89,12 +183,16 @@ def main():
                     manifest_name = alt[0]
 
             if manifest_name:
-                with zipf.open(manifest_name) as manifest_file:
-                    manifest_data = json.load(manifest_file)
-                    new_version = manifest_data.get('version', '0.0.0')
+                manifest_data = json.loads(zipf.read(manifest_name))
+                new_version = manifest_data.get('version', '0.0.0')
             else:
                 log("Warning: No manifest file found inside the update package.")
 
+            # استخراج مجلد taco_geo_processor فقط (تمرير ZipInfo يتجنب البحث بالاسم مجدداً)
+            members = [info for info in infolist if info.filename.startswith(ZIP_PREFIX)]
+            zipf.extractall(app_dir, members=members)
+        log("تم استخراج الملفات الجديدة بنجاح.")
+
         # 5. Update the VERSION file
         if new_version != "0.0.0":
             log(f"Updating VERSION file to {new_version}...")
@@ -104,15 +202,19 @@ def main():
         else:
             log("Warning: Could not determine new version from manifest.")
 
-        # 6. حذف النسخة الاحتياطية بعد نجاح كل شيء
-        log("التحديث ناجح. يتم الآن حذف النسخة الاحتياطية...")
-        shutil.rmtree(backup_dir)
-        log("تم حذف النسخة الاحتياطية.")
-
-        # 7. إنشاء علامة النجاح
+        # 6. إنشاء علامة النجاح (قبل حذف النسخة الاحتياطية حتى تتابع العملية الأم فوراً)
         with open(success_flag, 'w') as f:
             f.write('success')
 
+        # 7. حذف النسخة الاحتياطية في الخلفية بعد نجاح كل شيء
+        log("التحديث ناجح. يتم الآن حذف النسخة الاحتياطية في الخلفية...")
+        remove_dir_in_background(backup_dir)
+        # ملف VERSION السابق يخص هذه النسخة الاحتياطية فقط؛ لا يُترك ليُستعاد لاحقاً بالخطأ
+        try:
+            os.remove(version_backup)
+        except FileNotFoundError:
+            pass
+
         log("اكتملت عملية تطبيق التحديث بنجاح!")
 
     except Exception as e:
@@ -121,9 +223,7 @@ def main():
         
         # Rollback: استرجاع النسخة الاحتياطية
         if os.path.exists(backup_dir):
-            if os.path.exists(target_dir):
-                shutil.rmtree(target_dir) # حذف الملفات الجديدة غير المكتملة
-            shutil.move(backup_dir, target_dir)
+            restore_backup(backup_dir, app_dir)
             log("تم استرجاع النسخة الاحتياطية بنجاح.")
         else:
             log("خطأ في الإرجاع: النسخة الاحتياطية غير موجودة!")
@@ -33,26 +33,67 @@
 
 import os
 import sys
+import re
 import json
+import codecs
+import functools
 import hashlib
+import mmap
 import zipfile
 import argparse
 import subprocess
 import base64
 import tempfile
 import shutil
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import urllib.parse
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives import serialization
 from cryptography.exceptions import InvalidSignature
+from packaging.version import Version, InvalidVersion
+
+# تحليل JSON أسرع عبر orjson إن كانت مثبتة (يقبل bytes مباشرة دون فك ترميز).
+# كلا الفرعين يقبلان UTF-8 فقط (RFC 8259) مع BOM اختياري، كما في update_client_new.py
+try:
+    import orjson
+
+    def json_loads(data):
+        if data.startswith(codecs.BOM_UTF8):  # orjson ترفض الـ BOM
+            data = data[len(codecs.BOM_UTF8):]
+        return orjson.loads(data)
+except ImportError:
+    def json_loads(data):
+        return json.loads(data.decode('utf-8-sig'))
+
+# فك ضغط أسرع (SIMD) عبر zlib-ng إن كانت مثبتة؛ واجهة zipfile تبقى كما هي
+try:
+    from zlib_ng import zlib_ng as _fast_zlib
+    zipfile.zlib = _fast_zlib
+    zipfile.crc32 = _fast_zlib.crc32
+except ImportError:
+    pass
 
 # --- إعدادات ومسارات ---
 APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 VERSION_FILE = os.path.join(APP_DIR, 'VERSION')
 PUBLIC_KEY_FILE = os.path.join(APP_DIR, 'keys', 'public_key.pem')
 APPLY_UPDATE_SCRIPT = os.path.join(os.path.dirname(__file__), 'apply_update.py')
+ZIP_PREFIX = 'taco_geo_processor/'  # مسارات ZIP تستخدم دائماً '/'
+HASH_CHUNK_SIZE = 1 << 20  # 1 MiB
+MMAP_HASH_MIN_SIZE = 4 << 20  # الملفات الأكبر من هذا تُمرَّر إلى hashlib عبر mmap
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+DOWNLOAD_CHUNK_SIZE = 4 << 20  # 4 MiB
+_GDRIVE_ID_RE = re.compile(r'(?:/file/d/|[?&]id=)([^/&?#]+)')
+
+# جلسة HTTP مشتركة لإعادة استخدام اتصال TCP/TLS بين جلب الـ manifest وتحميل الحزمة
+SESSION = requests.Session()
+SESSION.headers.update({'User-Agent': 'TacoGeoProcessor-Updater'})
+SESSION.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+SESSION.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
 
 # --- دوال مساعدة ---
 
@@ -64,14 +105,42 @@ def get_current_version():
     except FileNotFoundError:
         return "0.0.0"
 
+@functools.lru_cache(maxsize=None)
+def parse_version(version_str):
+    """يحوّل رقم الإصدار إلى كائن Version للمقارنة الصحيحة (1.10.0 > 1.9.0)."""
+    try:
+        return Version(version_str)
+    except InvalidVersion:
+        print(f"تحذير: رقم إصدار غير صالح: {version_str}")
+        return Version("0")
+
 def calculate_sha256(file_path):
     """يحسب SHA-256 hash لملف معين."""
-    sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
+    # نقوم بالقراءة بكتل كبيرة بأنفسنا، لذا لا حاجة للتخزين المؤقت
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        # الملفات الكبيرة تُمرَّر كاملة إلى OpenSSL في استدعاء واحد دون نسخ
+        if MMAP_HASH_MIN_SIZE <= size <= sys.maxsize:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return hashlib.sha256(mm).hexdigest()
+            except (OSError, OverflowError):
+                # لا تتسع مساحة العناوين (مثلاً مفسر 32-بت)؛ نعود للقراءة بالكتل
+                pass
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        sha256_hash = hashlib.sha256()
+        for byte_block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest()
 
+def calculate_stream_sha256(stream):
+    """يحسب SHA-256 hash لمحتوى تدفق ثنائي (مثل ملف داخل ZIP) دون كتابته على القرص."""
+    sha256_hash = hashlib.sha256()
+    for byte_block in iter(lambda: stream.read(HASH_CHUNK_SIZE), b""):
+        sha256_hash.update(byte_block)
+    return sha256_hash.hexdigest()
+
 def verify_signature(data_bytes, signature_b64, public_key):
     """يتحقق من صحة التوقيع الرقمي."""
     try:
@@ -92,24 +161,20 @@ def verify_signature(data_bytes, signature_b64, public_key):
         print(f"حدث خطأ غير متوقع أثناء التحقق من التوقيع: {e}")
         return False
 
+@functools.lru_cache(maxsize=32)
 def get_direct_download_link(gdrive_url):
     """تحويل رابط Google Drive العادي إلى رابط تحميل مباشر."""
     # التحقق من أن الرابط هو رابط Google Drive
     if "drive.google.com" not in gdrive_url:
         return gdrive_url
 
-    # استخراج معرف الملف من الرابط
-    file_id = None
-    if "/file/d/" in gdrive_url:
-        file_id = gdrive_url.split("/file/d/")[1].split("/")[0]
-    elif "id=" in gdrive_url:
-        file_id = gdrive_url.split("id=")[1].split("&")[0]
-
-    if not file_id:
+    # استخراج معرف الملف من الرابط (/file/d/<id> أو ?id=<id>)
+    match = _GDRIVE_ID_RE.search(gdrive_url)
+    if not match:
         return gdrive_url
 
     # إنشاء رابط التحميل المباشر
-    return f"https://drive.google.com/uc?export=download&id={file_id}"
+    return f"https://drive.google.com/uc?export=download&id={match.group(1)}"
 
 def download_file(url, destination):
     """تحميل ملف من رابط معين وحفظه في المسار المحدد."""
@@ -118,13 +183,14 @@ def download_file(url, destination):
         direct_url = get_direct_download_link(url)
 
         # استخدام requests لتحميل الملف
-        response = requests.get(direct_url, stream=True)
-        response.raise_for_status()
+        with SESSION.get(direct_url, stream=True) as response:
+            response.raise_for_status()
+            # فك ضغط gzip/deflate إن أرسله الخادم، كما كان يفعل iter_content
+            response.raw.decode_content = True
 
-        # حفظ الملف
-        with open(destination, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+            # حفظ الملف بكتل كبيرة عبر حلقة النسخ في shutil
+            with open(destination, 'wb') as f:
+                shutil.copyfileobj(response.raw, f, length=DOWNLOAD_CHUNK_SIZE)
 
         print(f"تم تحميل الملف بنجاح إلى: {destination}")
         return True
@@ -132,30 +198,36 @@ def download_file(url, destination):
         print(f"فشل تحميل الملف: {e}")
         return False
 
+@functools.cache
+def load_public_key():
+    """تحميل المفتاح العام من الملف (مرة واحدة لكل عملية)."""
+    try:
+        with open(PUBLIC_KEY_FILE, "rb") as key_file:
+            return serialization.load_pem_public_key(key_file.read())
+    except FileNotFoundError:
+        print(f"خطأ فادح: المفتاح العام غير موجود في {PUBLIC_KEY_FILE}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"خطأ أثناء تحميل المفتاح العام: {e}")
+        sys.exit(1)
+
 # --- المنطق الرئيسي ---
 
 class UpdateHandler:
     def __init__(self, update_path=""):
         self.update_path = update_path
-        self.temp_dir = None
         self.manifest = None
         self.public_key = self._load_public_key()
+        self.current_version = get_current_version()
+        self._current_ver = parse_version(self.current_version)
 
     def _load_public_key(self):
         """تحميل المفتاح العام من الملف."""
-        try:
-            with open(PUBLIC_KEY_FILE, "rb") as key_file:
-                return serialization.load_pem_public_key(key_file.read())
-        except FileNotFoundError:
-            print(f"خطأ فادح: المفتاح العام غير موجود في {PUBLIC_KEY_FILE}")
-            sys.exit(1)
-        except Exception as e:
-            print(f"خطأ أثناء تحميل المفتاح العام: {e}")
-            sys.exit(1)
+        return load_public_key()
 
     def pre_check(self):
         """
-        يقوم بالتحقق المبدئي من حزمة التحديث (فك الضغط المؤقت، التحقق من التوقيع والـ hashes).
+        يقوم بالتحقق المبدئي من حزمة التحديث (التحقق من التوقيع والـ hashes مباشرة من داخل الـ ZIP).
         """
         print(f"بدء التحقق من حزمة التحديث: {self.update_path}")
 
@@ -164,11 +236,9 @@ class UpdateHandler:
             return False
 
         try:
-            self.temp_dir = tempfile.mkdtemp()
             with zipfile.ZipFile(self.update_path, 'r') as zipf:
                 # 1. استخراج الـ manifest
-                manifest_str = zipf.read('update_manifest.json').decode('utf-8')
-                self.manifest = json.loads(manifest_str)
+                self.manifest = json_loads(zipf.read('update_manifest.json'))
 
                 # 2. التحقق من التوقيع
                 print("التحقق من التوقيع الرقمي للـ manifest...")
@@ -177,46 +247,75 @@ class UpdateHandler:
                     print("خطأ: الـ manifest غير موقّع!")
                     return False
 
+                # الحمولة الموقّعة تُبنى بـ json القياسية: مخرجات orjson المضغوطة لا تطابقها بايتياً
                 manifest_bytes = json.dumps(self.manifest, sort_keys=True, ensure_ascii=False).encode('utf-8')
-                if not verify_signature(manifest_bytes, signature, self.public_key):
-                    print("خطأ فادح: التوقيع الرقمي غير صالح! قد تكون الحزمة تالفة أو تم التلاعب بها.")
-                    return False
-                print("التوقيع الرقمي صالح.")
 
                 # 3. التحقق من hashes الملفات
-                print("التحقق من سلامة الملفات (hashes)...")
+                info_by_path = {info.filename: info for info in zipf.infolist()}
+                tasks = []
                 for file_info in self.manifest['files']:
-                    zipf.extract(os.path.join('taco_geo_processor', file_info['path']), path=self.temp_dir)
-                    extracted_file_path = os.path.join(self.temp_dir, 'taco_geo_processor', file_info['path'])
-
-                    if not os.path.exists(extracted_file_path):
-                        print(f"خطأ: الملف {file_info['path']} مفقود من الحزمة.")
+                    # مسارات ZIP تستخدم دائماً '/' بغض النظر عن نظام التشغيل
+                    path = file_info['path'].replace('\\', '/')
+                    info = info_by_path.get(ZIP_PREFIX + path)
+                    if info is None:
+                        print(f"خطأ: الملف {path} مفقود من الحزمة.")
                         return False
-
-                    calculated_hash = calculate_sha256(extracted_file_path)
-                    if calculated_hash != file_info['hash']:
-                        print(f"خطأ: الـ hash للملف {file_info['path']} غير متطابق.")
-                        return False
-                print("جميع الملفات سليمة.")
+                    tasks.append((path, info, file_info['hash']))
+
+                # لكل خيط مقبض ZIP خاص به: ZipFile لا يضمن أمان القراءة المتزامنة من نفس الكائن
+                # (open و close يعدّلان عدّاد المراجع دون قفل). ZipInfo يصلح لأي مقبض على نفس الحزمة
+                local = threading.local()
+                handles = []
+
+                def _verify_one(task):
+                    # حساب الـ hash مباشرة من الـ ZIP دون استخراج الملف إلى القرص
+                    path, info, expected_hash = task
+                    handle = getattr(local, 'zipf', None)
+                    if handle is None:
+                        handle = local.zipf = zipfile.ZipFile(self.update_path, 'r')
+                        handles.append(handle)
+                    with handle.open(info) as fp:
+                        # الـ SHA-256 الموقّع أقوى من CRC32، فلا داعي لحساب CRC على نفس البايتات
+                        # (يتخطى ZipExtFile حساب CRC عندما لا توجد قيمة مرجعية)
+                        fp._expected_crc = None
+                        return calculate_stream_sha256(fp) == expected_hash
+
+                # hashlib و OpenSSL يحرران الـ GIL، لذا يتم التحقق من التوقيع
+                # وحساب الـ hashes بالتوازي فعلياً على عدة خيوط
+                try:
+                    with ThreadPoolExecutor(max_workers=HASH_WORKERS + 1) as executor:
+                        sig_future = executor.submit(verify_signature, manifest_bytes, signature, self.public_key)
+                        print("التحقق من سلامة الملفات (hashes)...")
+                        futures = {executor.submit(_verify_one, task): task[0] for task in tasks}
+                        for future in as_completed(futures):
+                            if not future.result():
+                                print(f"خطأ: الـ hash للملف {futures[future]} غير متطابق.")
+                                for pending in futures:
+                                    pending.cancel()
+                                return False
+                        print("جميع الملفات سليمة.")
+
+                        if not sig_future.result():
+                            print("خطأ فادح: التوقيع الرقمي غير صالح! قد تكون الحزمة تالفة أو تم التلاعب بها.")
+                            return False
+                finally:
+                    for handle in handles:
+                        handle.close()
+                print("التوقيع الرقمي صالح.")
 
             return True
         except Exception as e:
             print(f"حدث خطأ أثناء التحقق من الحزمة: {e}")
             return False
-        finally:
-            # تنظيف الملفات المؤقتة
-            if self.temp_dir and os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
 
     def check_for_update(self):
         """يعرض معلومات التحديث المتاحة."""
         if self.pre_check():
-            current_version = get_current_version()
             print("\n--- فحص التحديثات ---")
-            print(f"الإصدار الحالي: {current_version}")
+            print(f"الإصدار الحالي: {self.current_version}")
             print(f"الإصدار المتاح: {self.manifest['version']}")
             print(f"ملاحظات الإصدار: {self.manifest['release_notes']}")
-            if self.manifest['version'] > current_version:
+            if parse_version(self.manifest['version']) > self._current_ver:
                 print("يوجد تحديث جديد متاح.")
             else:
                 print("أنت تستخدم أحدث إصدار بالفعل.")
@@ -227,8 +326,7 @@ class UpdateHandler:
             print("فشل التحقق المبدئي. تم إلغاء التحديث.")
             return
 
-        current_version = get_current_version()
-        if self.manifest['version'] <= current_version:
+        if parse_version(self.manifest['version']) <= self._current_ver:
             print("أنت تستخدم أحدث إصدار بالفعل. لا حاجة للتحديث.")
             return
 
@@ -256,10 +354,10 @@ class UpdateHandler:
             print(f"جاري جلب ملف البيانات الوصفية من: {url}")
             direct_url = get_direct_download_link(url)
 
-            response = requests.get(direct_url)
+            response = SESSION.get(direct_url)
             response.raise_for_status()
 
-            self.manifest = json.loads(response.text)
+            self.manifest = json_loads(response.content)
             print("تم جلب ملف البيانات الوصفية بنجاح.")
             return True
         except Exception as e:
@@ -271,13 +369,12 @@ class UpdateHandler:
         if not self.fetch_manifest(url):
             return False
 
-        current_version = get_current_version()
         print("\n--- فحص التحديثات ---")
-        print(f"الإصدار الحالي: {current_version}")
+        print(f"الإصدار الحالي: {self.current_version}")
         print(f"الإصدار المتاح: {self.manifest['version']}")
         print(f"ملاحظات الإصدار: {self.manifest['release_notes']}")
 
-        if self.manifest['version'] > current_version:
+        if parse_version(self.manifest['version']) > self._current_ver:
             print("يوجد تحديث جديد متاح.")
             return True
         else:
@@ -23,7 +23,7 @@
        الـ hash المسجل في الـ manifest.
 4.  عند تطبيق التحديث (`--apply`):
     a. يتأكد أن إصدار التحديث أعلى من الإصدار الحالي.
-    b. يشغل `apply_update.py` كعملية منفصلة (subprocess).
+    b. يشغل `apply_update.py` كعملية منفصلة (fork مع استدعاء مباشر، أو subprocess على ويندوز).
     c. ينتظر انتهاء عملية التحديث ويتحقق من وجود علامة النجاح.
     d. يعيد تشغيل التطبيق الرئيسي.
 5.  عند التحقق من التحديثات عبر الإنترنت:
@@ -43,25 +43,69 @@ import os
 import sys
 import re
 import json
+import codecs
 import hashlib
+import mmap
 import zipfile
 import argparse
 import subprocess
 import base64
 import tempfile
 import shutil
+import threading
+import importlib.util
+import functools
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from packaging.version import Version, InvalidVersion
 import urllib.parse
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.asymmetric import padding
 from cryptography.hazmat.primitives import serialization
 from cryptography.exceptions import InvalidSignature
 
+# تحليل JSON أسرع عبر orjson إن كانت مثبتة: تقبل bytes مباشرة وتتحقق من UTF-8 أثناء التحليل
+# دون نسخة str وسيطة. كلا الفرعين يقبلان UTF-8 فقط (RFC 8259) مع BOM اختياري.
+# json_dumps_bytes تنتج UTF-8 دون تهريب الأحرف العربية (مثل ensure_ascii=False).
+try:
+    import orjson
+
+    def json_loads(data):
+        if data.startswith(codecs.BOM_UTF8):  # orjson ترفض الـ BOM
+            data = data[len(codecs.BOM_UTF8):]
+        return orjson.loads(data)
+
+    json_dumps_bytes = orjson.dumps
+except ImportError:
+    def json_loads(data):
+        return json.loads(data.decode('utf-8-sig'))
+
+    def json_dumps_bytes(obj):
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
 # --- إعدادات ومسارات ---
 APP_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 VERSION_FILE = os.path.join(APP_DIR, 'VERSION')
 PUBLIC_KEY_FILE = os.path.join(APP_DIR, 'keys', 'public_key.pem')
 APPLY_UPDATE_SCRIPT = os.path.join(os.path.dirname(__file__), 'apply_update.py')
+HASH_CHUNK_SIZE = 1 << 20  # 1 MiB
+MMAP_HASH_MIN_SIZE = 4 << 20  # الملفات الأكبر من هذا تُمرَّر إلى hashlib عبر mmap
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+DOWNLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
+RANGE_DOWNLOAD_MIN_SIZE = 16 << 20  # الحزم الأكبر من هذا تُحمَّل على أجزاء متوازية
+RANGE_DOWNLOAD_PARTS = 4
+_GDRIVE_ID_RE = re.compile(r'(?:/file/d/|[?&]id=)([A-Za-z0-9_-]+)')
+
+# جلسة HTTP مشتركة طوال عمر العملية: تعيد استخدام اتصال TCP/TLS بين جلب الـ manifest
+# وطلبي التحميل (بما فيها طلب تأكيد Google Drive) بدلاً من مصافحة جديدة لكل طلب
+_http_session = requests.Session()
+_http_session.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+))
 
 # --- دوال مساعدة ---
 
@@ -73,12 +117,40 @@ def get_current_version():
     except FileNotFoundError:
         return "0.0.0"
 
+@functools.lru_cache(maxsize=None)
+def parse_version(version_str):
+    """يحوّل رقم الإصدار إلى كائن Version للمقارنة الصحيحة (0.10.0 > 0.9.0)."""
+    try:
+        return Version(version_str)
+    except InvalidVersion:
+        print(f"تحذير: رقم إصدار غير صالح: {version_str}", file=sys.stderr)
+        return Version("0")
+
 def calculate_sha256(file_path):
     """يحسب SHA-256 hash لملف معين."""
+    with open(file_path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        # الملفات الكبيرة تُمرَّر كاملة إلى OpenSSL في استدعاء واحد دون نسخ
+        # (الملفات الفارغة لا تصل هنا: mmap يرفض الحجم 0)
+        if MMAP_HASH_MIN_SIZE <= size <= sys.maxsize:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return hashlib.sha256(mm).hexdigest()
+            except (OSError, OverflowError):
+                # لا تتسع مساحة العناوين (مثلاً مفسر 32-بت)؛ نعود للقراءة بالكتل
+                pass
+        return calculate_stream_sha256(f)
+
+def calculate_stream_sha256(stream):
+    """يحسب SHA-256 hash لمحتوى تدفق ثنائي (ملف أو ملف داخل ZIP) دون كتابته على القرص."""
+    if hasattr(hashlib, 'file_digest'):  # Python 3.11+: حلقة القراءة بالكامل داخل C
+        return hashlib.file_digest(stream, 'sha256').hexdigest()
     sha256_hash = hashlib.sha256()
-    with open(file_path, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
-            sha256_hash.update(byte_block)
+    # مخزن واحد يُعاد استخدامه لكل الكتل بدلاً من إنشاء bytes جديد في كل قراءة
+    buf = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buf)
+    while n := stream.readinto(buf):
+        sha256_hash.update(view[:n])
     return sha256_hash.hexdigest()
 
 def verify_signature(data_bytes, signature_b64, public_key):
@@ -110,24 +182,70 @@ def get_direct_download_link(gdrive_url):
         print("Warning: URL is not a Google Drive link", file=sys.stderr)
         return gdrive_url
 
-    # استخراج معرف الملف من الرابط
-    file_id = None
-    if "/file/d/" in gdrive_url:
-        file_id = gdrive_url.split("/file/d/")[1].split("/")[0]
-    elif "id=" in gdrive_url:
-        file_id = gdrive_url.split("id=")[1].split("&")[0]
-
-    if not file_id:
+    # استخراج معرف الملف من الرابط (/file/d/<id> أو ?id=<id>)
+    match = _GDRIVE_ID_RE.search(gdrive_url)
+    if not match:
         print("Warning: Could not extract file ID from URL", file=sys.stderr)
         return gdrive_url
 
     # إنشاء رابط التحميل المباشر
-    direct_url = f"https://drive.google.com/uc?export=download&id={file_id}"
+    direct_url = f"https://drive.google.com/uc?export=download&id={match.group(1)}"
     print(f"Generated direct download URL: {direct_url}", file=sys.stderr)
     return direct_url
 
-def download_file(url, destination):
-    """تحميل ملف من رابط معين وحفظه في المسار المحدد."""
+def preallocate_file(f, size):
+    """يحجز مساحة الملف مسبقاً لتقليل التجزئة وتحديثات البيانات الوصفية أثناء الكتابة."""
+    try:
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), 0, size)
+        else:  # Windows: تحديد طول الملف مرة واحدة
+            f.truncate(size)
+    except OSError:
+        # نظام الملفات لا يدعم الحجز المسبق؛ نكمل الكتابة العادية
+        pass
+
+def download_ranges(url, destination, size, headers):
+    """
+    يحمّل الملف على RANGE_DOWNLOAD_PARTS أجزاء متوازية عبر طلبات Range، يكتب كل جزء
+    في موضعه من ملف محجوز مسبقاً. يعيد False إن لم يلتزم الخادم بالنطاقات (رد غير 206)
+    ليعود المستدعي إلى التحميل التسلسلي.
+    """
+    part_size = -(-size // RANGE_DOWNLOAD_PARTS)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    with open(destination, 'wb') as f:
+        preallocate_file(f, size)
+
+    def _fetch(byte_range):
+        start, end = byte_range
+        range_headers = dict(headers, Range=f'bytes={start}-{end}')
+        with _http_session.get(url, headers=range_headers, stream=True) as response:
+            content_range = response.headers.get('content-range', '')
+            if response.status_code != 206 or not content_range.startswith(f'bytes {start}-{end}/'):
+                return False
+            # لكل خيط مقبض ملف خاص (os.pwrite غير متوفرة على ويندوز)
+            written = 0
+            with open(destination, 'r+b') as f:
+                f.seek(start)
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+        return written == end - start + 1
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            return all(executor.map(_fetch, ranges))
+    except (requests.RequestException, OSError) as e:
+        print(f"فشل التحميل المتوازي ({e})، يتم التحميل التسلسلي...", file=sys.stderr)
+        return False
+
+def download_file(url, destination, compute_hash=False):
+    """
+    تحميل ملف من رابط معين وحفظه في المسار المحدد.
+    يعيد (True, sha256) عند النجاح و(False, None) عند الفشل. الـ hash يُحسب فقط عند طلبه
+    (compute_hash)، وفي التحميل التسلسلي يُحسب أثناء الكتابة نفسها دون إعادة قراءة الملف؛
+    بدون الطلب تكون قيمته None.
+    """
     try:
         print(f"جاري تحميل الملف من: {url}", file=sys.stderr)
         
@@ -143,19 +261,20 @@ def download_file(url, destination):
                     print(f"نسخ ملف محلي من: {local_path}", file=sys.stderr)
                     shutil.copy2(local_path, destination)
                     print(f"تم نسخ الملف المحلي بنجاح إلى: {destination}", file=sys.stderr)
-                    return True
+                    return True, calculate_sha256(destination) if compute_hash else None
                 else:
                     print(f"خطأ: الملف المحلي غير موجود: {local_path}", file=sys.stderr)
-                    return False
+                    return False, None
             except Exception as e:
                 print(f"خطأ في التعامل مع الملف المحلي: {str(e)}", file=sys.stderr)
-                return False
+                return False, None
         
         # التعامل مع روابط الإنترنت
         direct_url = get_direct_download_link(url)
         
-        session = requests.Session()
-        response = session.get(direct_url, stream=True)
+        # بدون ضغط أثناء النقل حتى يكون Content-Length هو الحجم الفعلي للملف
+        headers = {'Accept-Encoding': 'identity'}
+        response = _http_session.get(direct_url, headers=headers, stream=True)
         
         token = None
         for key, value in response.cookies.items():
@@ -164,56 +283,117 @@ def download_file(url, destination):
                 break
         
         if token:
-            file_id = None
-            if "id=" in direct_url:
-                file_id = direct_url.split("id=")[1].split("&")[0]
-            
-            if file_id:
-                params = {'id': file_id, 'confirm': token}
-                response = session.get("https://drive.google.com/uc?export=download", params=params, stream=True)
+            match = _GDRIVE_ID_RE.search(direct_url)
+            if match:
+                params = {'id': match.group(1), 'confirm': token}
+                response.close()  # إعادة الاتصال إلى المجمّع ليُستخدم في طلب التأكيد
+                response = _http_session.get("https://drive.google.com/uc?export=download", params=params, headers=headers, stream=True)
 
         response.raise_for_status()
 
         # Check if we got a valid response
         if response.status_code != 200:
             print(f"Error: HTTP status code {response.status_code}", file=sys.stderr)
-            return False
+            return False, None
 
         # Check content length
         content_length = response.headers.get('content-length')
         if content_length and int(content_length) == 0:
             print("Error: Downloaded file is empty", file=sys.stderr)
-            return False
+            return False, None
+
+        expected_size = int(content_length) if content_length else 0
+
+        # الحزم الكبيرة من خوادم تدعم Range (مثل Google Drive) تُحمَّل على عدة اتصالات متوازية
+        if (expected_size >= RANGE_DOWNLOAD_MIN_SIZE
+                and response.headers.get('accept-ranges', '').lower() == 'bytes'):
+            range_url = response.url  # الرابط النهائي بعد إعادة التوجيه وطلب التأكيد
+            response.close()
+            if download_ranges(range_url, destination, expected_size, headers):
+                print(f"تم تحميل الملف بنجاح إلى: {destination} (حجم: {expected_size} بايت)", file=sys.stderr)
+                # الأجزاء تصل بغير ترتيب فلا يمكن دمج الـ hash في الكتابة؛ يُقرأ الملف مجدداً عند طلبه فقط
+                return True, calculate_sha256(destination) if compute_hash else None
+            response = _http_session.get(range_url, headers=headers, stream=True)
+            response.raise_for_status()
 
         # حفظ الملف
         total_size = 0
+        pkg_hasher = hashlib.sha256() if compute_hash else None
         with open(destination, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
+            if expected_size:
+                preallocate_file(f, expected_size)
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
                 if chunk:  # filter out keep-alive chunks
                     f.write(chunk)
+                    if pkg_hasher is not None:
+                        pkg_hasher.update(chunk)
                     total_size += len(chunk)
+            if total_size != expected_size:
+                # إزالة أي مساحة محجوزة زائدة إن اختلف الحجم الفعلي عن المعلن
+                f.truncate(total_size)
 
         # Verify the file was downloaded and has content
         if total_size == 0:
             print("Error: No content was downloaded", file=sys.stderr)
             if os.path.exists(destination):
                 os.remove(destination)
-            return False
+            return False, None
 
         print(f"تم تحميل الملف بنجاح إلى: {destination} (حجم: {total_size} بايت)", file=sys.stderr)
-        return True
+        return True, pkg_hasher.hexdigest() if pkg_hasher is not None else None
     except Exception as e:
         print(f"فشل تحميل الملف: {e}", file=sys.stderr)
-        return False
+        return False, None
 
 # --- المنطق الرئيسي ---
 
+def launch_apply_update(argv):
+    """
+    يشغّل `apply_update.main(argv)` في عملية منفصلة مستقلة عن هذه العملية.
+    حيث يتوفر fork تُنسخ العملية الحالية وتُستدعى main() مباشرة دون بدء مفسّر جديد
+    أو إعادة استيراد المكتبات؛ على ويندوز (لا fork) يبقى تشغيل السكربت عبر subprocess.
+    """
+    if not hasattr(os, 'fork'):
+        subprocess.Popen([sys.executable, APPLY_UPDATE_SCRIPT, *argv])
+        return
+
+    # التحميل من مسار الملف يعمل سواء شُغّل هذا السكربت مباشرة أو استورد من مكان آخر
+    spec = importlib.util.spec_from_file_location('apply_update', APPLY_UPDATE_SCRIPT)
+    apply_module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(apply_module)
+
+    # تفريغ المخازن قبل fork حتى لا تكرر العملية الابنة المخرجات المعلقة
+    sys.stdout.flush()
+    sys.stderr.flush()
+    if os.fork() == 0:
+        # العملية الابنة: الانفصال عن الأم، التطبيق، ثم الخروج برمز النتيجة
+        exit_code = 1
+        try:
+            os.setsid()
+            apply_module.main(argv)
+            exit_code = 0
+        except SystemExit as e:
+            exit_code = e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            print(f"فشل تطبيق التحديث: {e}", file=sys.stderr)
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+
 class UpdateHandler:
     def __init__(self, update_path):
         self.update_path = update_path
-        self.temp_dir = None
         self.manifest = None
-        self.public_key = self._load_public_key()
+        self._public_key = None
+        self.package_hash = None  # SHA-256 للحزمة المحمّلة، يُحسب أثناء التحميل عند طلبه فقط
+
+    @property
+    def public_key(self):
+        """المفتاح العام، يُحمَّل عند أول استخدام فقط (مسارات التحميل والتراجع لا تحتاجه)."""
+        if self._public_key is None:
+            self._public_key = self._load_public_key()
+        return self._public_key
 
     def _load_public_key(self):
         """تحميل المفتاح العام من الملف."""
@@ -229,7 +409,7 @@ class UpdateHandler:
 
     def pre_check(self):
         """
-        يقوم بالتحقق المبدئي من حزمة التحديث (فك الضغط المؤقت، التحقق من التوقيع والـ hashes).
+        يقوم بالتحقق المبدئي من حزمة التحديث (التحقق من التوقيع والـ hashes مباشرة من داخل الـ ZIP).
         """
         print(f"بدء التحقق من حزمة التحديث: {self.update_path}", file=sys.stderr)
 
@@ -238,73 +418,74 @@ class UpdateHandler:
             return False
 
         try:
-            self.temp_dir = tempfile.mkdtemp()
             with zipfile.ZipFile(self.update_path, 'r') as zipf:
                 # 1. استخراج الـ manifest (محاولة ذكية للعثور على الاسم الصحيح)
-                names = set(zipf.namelist())
-                manifest_name = None
+                # فهرسة الـ central directory مرة واحدة وجمع مرشحي الـ manifest في نفس المرور
+                info_map = {}
+                manifest_candidates = []
+                for zi in zipf.infolist():
+                    info_map[zi.filename] = zi
+                    if zi.filename.lower().endswith('update_manifest.json'):
+                        manifest_candidates.append(zi)
+                manifest_info = None
                 for candidate in ('update_manifest.json', 'Survey_new_vergn_update_manifest.json'):
-                    if candidate in names:
-                        manifest_name = candidate
+                    if candidate in info_map:
+                        manifest_info = info_map[candidate]
                         break
-                if not manifest_name:
-                    alt = [n for n in names if n.lower().endswith('update_manifest.json')]
-                    if alt:
-                        manifest_name = alt[0]
-                if not manifest_name:
+                if manifest_info is None and manifest_candidates:
+                    manifest_info = manifest_candidates[0]
+                if manifest_info is None:
                     print("خطأ: ملف manifest غير موجود داخل الحزمة.", file=sys.stderr)
                     return False
 
-                # Try different encodings for the manifest file
-                manifest_bytes = zipf.read(manifest_name)
-                manifest_str = None
-                encodings_to_try = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
-                
-                for encoding in encodings_to_try:
-                    try:
-                        manifest_str = manifest_bytes.decode(encoding)
-                        print(f"Successfully decoded manifest using {encoding} encoding", file=sys.stderr)
-                        break
-                    except UnicodeDecodeError:
-                        continue
-                
-                if manifest_str is None:
-                    # If all encodings fail, try with error handling
-                    manifest_str = manifest_bytes.decode('utf-8', errors='replace')
-                    print("Used UTF-8 with error replacement for manifest decoding", file=sys.stderr)
-                
-                self.manifest = json.loads(manifest_str)
+                # JSON must be UTF-8 (RFC 8259); UnicodeDecodeError و JSONDecodeError كلاهما ValueError
+                raw_manifest = zipf.read(manifest_info)
+                try:
+                    self.manifest = json_loads(raw_manifest)
+                except ValueError as e:
+                    print(f"خطأ: ملف الـ manifest ليس JSON صالحاً بترميز UTF-8: {e}", file=sys.stderr)
+                    return False
 
                 # 2. التحقق من التوقيع
                 print("التحقق من التوقيع الرقمي للـ manifest...", file=sys.stderr)
-                signature = self.manifest.pop('signature', None)
-                if not signature:
+                embedded_signature = self.manifest.pop('signature', None)
+                sidecar_info = info_map.get(manifest_info.filename + '.sig')
+                if sidecar_info is not None:
+                    # توقيع منفصل (update_manifest.json.sig) على بايتات الـ manifest الخام كما هي:
+                    # لا إعادة تسلسل ولا اعتماد على تطابق مخرجات json.dumps مع أداة النشر
+                    signature = zipf.read(sidecar_info).strip()
+                    signed_bytes = raw_manifest
+                elif embedded_signature:
+                    # الصيغة القديمة: التوقيع داخل الـ manifest على نسخة json.dumps مرتبة المفاتيح.
+                    # تُبنى بـ json القياسية: مخرجات orjson المضغوطة لا تطابقها بايتياً
+                    signature = embedded_signature
+                    signed_bytes = json.dumps(self.manifest, sort_keys=True, ensure_ascii=False).encode('utf-8')
+                else:
                     print("خطأ: الـ manifest غير موقّع!", file=sys.stderr)
                     return False
 
-                manifest_bytes = json.dumps(self.manifest, sort_keys=True, ensure_ascii=False).encode('utf-8')
-                if not verify_signature(manifest_bytes, signature, self.public_key):
+                if not verify_signature(signed_bytes, signature, self.public_key):
                     print("خطأ فادح: التوقيع الرقمي غير صالح! قد تكون الحزمة تالفة أو تم التلاعب بها.", file=sys.stderr)
                     return False
                 print("التوقيع الرقمي صالح.", file=sys.stderr)
 
                 # 3. التحقق من hashes الملفات
                 print("التحقق من سلامة الملفات (hashes)...", file=sys.stderr)
+                entries = []
                 for file_info in self.manifest['files']:
                     # تصحيح: بناء المسار داخل الـ ZIP بشكل صحيح (دائماً slash)
                     zip_internal_path = ('taco_geo_processor/' + file_info['path']).replace('\\', '/')
-                    
-                    # استخراج الملف المحدد
-                    zipf.extract(zip_internal_path, path=self.temp_dir)
-                    
-                    # بناء المسار المحلي للملف المستخرج بشكل صحيح
-                    extracted_file_path = os.path.join(self.temp_dir, *zip_internal_path.split('/'))
-
-                    if not os.path.exists(extracted_file_path):
+
+                    zi = info_map.get(zip_internal_path)
+                    if zi is None:
                         print(f"خطأ: الملف {file_info['path']} مفقود من الحزمة.", file=sys.stderr)
                         return False
+                    entries.append((file_info, zi))
 
-                    calculated_hash = calculate_sha256(extracted_file_path)
+                # المرور على الملفات بترتيب مواقعها داخل الأرشيف (header_offset) بدلاً من ترتيب
+                # الـ manifest: القراءة تصبح تقدّماً واحداً للأمام يستفيد منه الـ prefetch في نظام التشغيل
+                entries.sort(key=lambda entry: entry[1].header_offset)
+                for file_info, calculated_hash in self._hash_entries(entries):
                     if calculated_hash != file_info['hash']:
                         print(f"خطأ: الـ hash للملف {file_info['path']} غير متطابق.", file=sys.stderr)
                         return False
@@ -314,10 +495,33 @@ class UpdateHandler:
         except Exception as e:
             print(f"حدث خطأ أثناء التحقق من الحزمة: {e}", file=sys.stderr)
             return False
+
+    def _hash_entries(self, entries):
+        """
+        يحسب hashes ملفات الحزمة بالتوازي ويعيد (file_info, hash) بنفس ترتيب المدخلات.
+        hashlib يحرر الـ GIL أثناء الحساب، ولكل خيط مقبض ZIP خاص به
+        حتى لا تتشارك الخيوط موضع القراءة في نفس الملف.
+        """
+        local = threading.local()
+        handles = []
+
+        def _hash_one(entry):
+            # ZipInfo يحمل الإزاحات الجاهزة، فيصلح لأي مقبض مفتوح على نفس الحزمة
+            file_info, zi = entry
+            zipf = getattr(local, 'zipf', None)
+            if zipf is None:
+                zipf = local.zipf = zipfile.ZipFile(self.update_path, 'r')
+                handles.append(zipf)
+            # حساب الـ hash مباشرة من الـ ZIP دون استخراج الملف إلى القرص
+            with zipf.open(zi) as fh:
+                return file_info, calculate_stream_sha256(fh)
+
+        try:
+            with ThreadPoolExecutor(max_workers=HASH_WORKERS) as executor:
+                return list(executor.map(_hash_one, entries))
         finally:
-            # تنظيف الملفات المؤقتة
-            if self.temp_dir and os.path.exists(self.temp_dir):
-                shutil.rmtree(self.temp_dir)
+            for zipf in handles:
+                zipf.close()
 
     def check_for_update(self):
         """يعرض معلومات التحديث المتاحة."""
@@ -327,7 +531,7 @@ class UpdateHandler:
             print(f"الإصدار الحالي: {current_version}", file=sys.stderr)
             print(f"الإصدار المتاح: {self.manifest['version']}", file=sys.stderr)
             print(f"ملاحظات الإصدار: {self.manifest['release_notes']}", file=sys.stderr)
-            if self.manifest['version'] > current_version:
+            if parse_version(self.manifest['version']) > parse_version(current_version):
                 print("يوجد تحديث جديد متاح.", file=sys.stderr)
             else:
                 print("أنت تستخدم أحدث إصدار بالفعل.", file=sys.stderr)
@@ -339,7 +543,7 @@ class UpdateHandler:
             return
 
         current_version = get_current_version()
-        if self.manifest['version'] <= current_version:
+        if parse_version(self.manifest['version']) <= parse_version(current_version):
             print("أنت تستخدم أحدث إصدار بالفعل. لا حاجة للتحديث.", file=sys.stderr)
             return
 
@@ -352,8 +556,7 @@ class UpdateHandler:
         try:
             # تشغيل apply_update.py كعملية منفصلة
             print("تشغيل سكربت تطبيق التحديث...", file=sys.stderr)
-            args = [sys.executable, APPLY_UPDATE_SCRIPT, self.update_path, APP_DIR]
-            subprocess.Popen(args)
+            launch_apply_update([self.update_path, APP_DIR])
 
             print("تم بدء عملية التحديث في الخلفية. سيتم إغلاق هذا التطبيق الآن.", file=sys.stderr)
             sys.exit(0) # الخروج للسماح للعملية الجديدة بالعمل
@@ -367,44 +570,33 @@ class UpdateHandler:
             print(f"Fetching manifest from: {url}", file=sys.stderr)
             
             # Download the manifest file directly
-            response = requests.get(url)
+            response = _http_session.get(url)
             response.raise_for_status()  # Raise an exception for bad status codes
             
-            # Try different encodings to handle the file properly
-            manifest_str = None
-            encodings_to_try = ['utf-8', 'utf-8-sig', 'latin-1', 'cp1252', 'iso-8859-1']
-            
-            for encoding in encodings_to_try:
-                try:
-                    manifest_str = response.content.decode(encoding)
-                    print(f"Successfully decoded manifest using {encoding} encoding", file=sys.stderr)
-                    break
-                except UnicodeDecodeError:
-                    continue
-            
-            if manifest_str is None:
-                # If all encodings fail, try with error handling
-                manifest_str = response.content.decode('utf-8', errors='replace')
-                print("Used UTF-8 with error replacement for manifest decoding", file=sys.stderr)
+            # The checks below work on the raw bytes; only the preview is decoded
+            content = response.content
+            preview = content[:200].decode('utf-8', errors='replace')
             
             # Check if the content is empty or invalid
-            if not manifest_str or manifest_str.strip() == "":
+            if not content.strip():
                 print("Error: Downloaded manifest is empty", file=sys.stderr)
                 return False, "Downloaded manifest is empty"
             
             # Check if it looks like HTML (Google Drive error page)
-            if manifest_str.strip().lower().startswith('<html') or 'google' in manifest_str.lower():
+            lowered = content.lower()
+            if lowered.lstrip().startswith(b'<html') or b'google' in lowered:
                 print("Error: Downloaded content appears to be an HTML page instead of JSON", file=sys.stderr)
-                print(f"Content preview: {manifest_str[:200]}...", file=sys.stderr)
+                print(f"Content preview: {preview}...", file=sys.stderr)
                 return False, "Downloaded content is not a valid JSON manifest"
             
-            print(f"Manifest content preview: {manifest_str[:200]}...", file=sys.stderr)
+            print(f"Manifest content preview: {preview}...", file=sys.stderr)
             
+            # JSON must be UTF-8 (RFC 8259); UnicodeDecodeError and JSONDecodeError are both ValueError
             try:
-                self.manifest = json.loads(manifest_str)
-            except json.JSONDecodeError as e:
-                print(f"Error: Failed to parse manifest as JSON: {e}", file=sys.stderr)
-                print(f"Raw content: {manifest_str}", file=sys.stderr)
+                self.manifest = json_loads(content)
+            except ValueError as e:
+                print(f"Error: Failed to parse manifest as UTF-8 JSON: {e}", file=sys.stderr)
+                print(f"Raw content: {content.decode('utf-8', errors='replace')}", file=sys.stderr)
                 return False, f"Invalid JSON format: {e}"
             
             # --- SIGNATURE VERIFICATION DISABLED FOR TESTING ---
@@ -430,8 +622,8 @@ class UpdateHandler:
         current_version = get_current_version()
         new_version = self.manifest.get('version', '0.0.0')
 
-        # Simple version comparison
-        if new_version > current_version:
+        # Semantic version comparison (a plain string compare gets "0.10.0" vs "0.9.0" wrong)
+        if parse_version(new_version) > parse_version(current_version):
             # The manifest should contain the direct download link for the package
             download_url = self.manifest.get('download_url')
             if not download_url:
@@ -450,44 +642,33 @@ class UpdateHandler:
                 "current_version": current_version
             }
 
-    def download_update(self, url, destination=None):
-        """يحمل حزمة التحديث من Google Drive."""
+    def download_update(self, url, destination=None, compute_hash=False):
+        """يحمل حزمة التحديث من Google Drive (مع حفظ الـ SHA-256 في package_hash عند طلبه)."""
         if not destination:
             destination = os.path.join(tempfile.gettempdir(), "update_package.zip")
 
         # The URL passed to this function should be the direct download link
         # from the manifest.
-        return download_file(url, destination)
+        success, self.package_hash = download_file(url, destination, compute_hash=compute_hash)
+        return success
 
 def _is_version_older(version1, version2):
     """تحديد إذا كان الإصدار الأول أقدم من الإصدار الثاني."""
-    def normalize_version(v):
-        # إزالة أي أحرف غير رقمية أو نقاط
-        clean_version = re.sub(r'[^0-9.]', '', v)
-        return [int(x) for x in clean_version.split('.')]
-        
     try:
-        v1_parts = normalize_version(version1)
-        v2_parts = normalize_version(version2)
-        
-        # ملء الأجزاء المفقودة بأصفار
-        max_len = max(len(v1_parts), len(v2_parts))
-        v1_parts.extend([0] * (max_len - len(v1_parts)))
-        v2_parts.extend([0] * (max_len - len(v2_parts)))
-        
-        # المقارنة جزء بجزء
-        for i in range(max_len):
-            if v1_parts[i] < v2_parts[i]:
-                return True
-            elif v1_parts[i] > v2_parts[i]:
-                return False
-                
-        return False  # الإصداران متساويان
-        
-    except Exception as e:
+        return Version(version1) < Version(version2)
+    except InvalidVersion as e:
         print(f"حدث خطأ أثناء مقارنة الإصدارات: {e}", file=sys.stderr)
         return False
 
+def _emit(result):
+    """يكتب نتيجة الأمر كـ JSON على stdout ليقرأها التطبيق الأم، ويعيد البايتات المكتوبة."""
+    try:
+        payload = json_dumps_bytes(result)
+    except Exception as e:
+        payload = json.dumps({"status": "error", "message": f"Failed to serialize result: {e}"}).encode('utf-8')
+    sys.stdout.buffer.write(payload)
+    return payload
+
 def main():
     parser = argparse.ArgumentParser(description="عميل التحديث المتقدم للتطبيق.")
     parser.add_argument('--check-update', metavar='PATH', help="فحص حزمة تحديث من مسار محلي أو URL.")
@@ -504,15 +685,8 @@ def main():
         if args.check_online:
             handler = UpdateHandler("")
             result = handler.check_for_update_from_url(args.check_online)
-            # Ensure we output valid JSON
-            try:
-                json_output = json.dumps(result, ensure_ascii=False)
-                print(f"Debug - Outputting JSON: {json_output}", file=sys.stderr)
-                sys.stdout.buffer.write(json_output.encode('utf-8'))
-            except Exception as e:
-                error_result = {"status": "error", "message": f"Failed to serialize result: {e}"}
-                print(f"Debug - Error serializing result: {e}", file=sys.stderr)
-                sys.stdout.buffer.write(json.dumps(error_result).encode('utf-8'))
+            json_output = _emit(result)
+            print(f"Debug - Outputting JSON: {json_output.decode('utf-8')}", file=sys.stderr)
 
         elif args.apply:
             handler = UpdateHandler(args.apply)
@@ -527,12 +701,7 @@ def main():
                 result = {"status": "success", "path": os.path.join(tempfile.gettempdir(), "update_package.zip")}
             else:
                 result = {"status": "error", "message": "Failed to download update."}
-            try:
-                json_output = json.dumps(result, ensure_ascii=False)
-                sys.stdout.buffer.write(json_output.encode('utf-8'))
-            except Exception as e:
-                error_result = {"status": "error", "message": f"Failed to serialize result: {e}"}
-                sys.stdout.buffer.write(json.dumps(error_result).encode('utf-8'))
+            _emit(result)
             
         elif args.rollback:
             # معالجة أمر التراجع عن التحديث
@@ -541,18 +710,11 @@ def main():
             if os.path.exists(backup_dir):
                 print(f"بدء عملية التراجع عن التحديث باستخدام النسخة الاحتياطية: {backup_dir}", file=sys.stderr)
                 # استدعاء سكربت التطبيق للتراجع
-                rollback_script = os.path.join(os.path.dirname(__file__), 'apply_update.py')
-                args_rollback = [sys.executable, rollback_script, '--rollback', backup_dir]
-                subprocess.Popen(args_rollback)
+                launch_apply_update(['--rollback', backup_dir])
                 sys.exit(0)
             else:
                 result = {"status": "error", "message": f"النسخة الاحتياطية غير موجودة: {backup_dir}"}
-                try:
-                    json_output = json.dumps(result, ensure_ascii=False)
-                    sys.stdout.buffer.write(json_output.encode('utf-8'))
-                except Exception as e:
-                    error_result = {"status": "error", "message": f"Failed to serialize result: {e}"}
-                    sys.stdout.buffer.write(json.dumps(error_result).encode('utf-8'))
+                _emit(result)
                 
         elif args.verify_update:
             # معالجة أمر التحقق فقط من صحة التحديث
@@ -561,12 +723,7 @@ def main():
                 result = {"status": "success", "message": "تم التحقق من صحة حزمة التحديث بنجاح"}
             else:
                 result = {"status": "error", "message": "فشل التحقق من صحة حزمة التحديث"}
-            try:
-                json_output = json.dumps(result, ensure_ascii=False)
-                sys.stdout.buffer.write(json_output.encode('utf-8'))
-            except Exception as e:
-                error_result = {"status": "error", "message": f"Failed to serialize result: {e}"}
-                sys.stdout.buffer.write(json.dumps(error_result).encode('utf-8'))
+            _emit(result)
             
         elif args.check_update:
             handler = UpdateHandler(args.check_update)
@@ -575,12 +732,7 @@ def main():
             parser.print_help(file=sys.stderr)
     except Exception as e:
         result = {"status": "error", "message": f"An unexpected error occurred: {str(e)}"}
-        try:
-            json_output = json.dumps(result, ensure_ascii=False)
-            sys.stdout.buffer.write(json_output.encode('utf-8'))
-        except Exception as json_e:
-            error_result = {"status": "error", "message": f"Failed to serialize error result: {json_e}"}
-            sys.stdout.buffer.write(json.dumps(error_result).encode('utf-8'))
+        _emit(result)
 
 if __name__ == "__main__":
     main()